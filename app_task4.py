@@ -1,85 +1,261 @@
+import os
+from pathlib import Path
+
 import streamlit as st
-import altair as alt
 import pandas as pd
 
 # --- 1. CONFIGURATION & FILE PATHS ---
+# Region -> (incidence CSV, RR prevalence CSV)
 DATA_FILES = {
-    "Global": {
-        "incidence": "GTB_report_2025_incidence.csv",
-        "rr": "GTB_report_2025_RR_prevalence.csv"
-    },
-    "WHO African Region": {
-        "incidence": "African_region_report_2025_incidence.csv",
-        "rr": "African_region_report_2025_RR_prevalence.csv"
-    },
-    "WHO/PAHO Region of the Americas": {
-        "incidence": "Region_of_the_Americas_report_2025_incidence.csv",
-        "rr": "Region_of_the_Americas_report_2025_RR_prevalence.csv"
-    },
-    "WHO Eastern Mediterranean Region": {
-        "incidence": "Eastern_Mediterranean_region_report_2025_incidence.csv",
-        "rr": "Eastern_Mediterranean_region_report_2025_RR_prevalence.csv"
-    },
-    "WHO European Region": {
-        "incidence": "European_region_report_2025_incidence.csv",
-        "rr": "European_region_report_2025_RR_prevalence.csv"
-    },
-    "WHO South-East Asia Region": {
-        "incidence": "South_East_Asia_Region_report_2025_incidence.csv",
-        "rr": "South_East_Asia_Region_report_2025_RR_prevalence.csv"
+    "Global": ("GTB_report_2025_incidence.csv", "GTB_report_2025_RR_prevalence.csv"),
+    "WHO African Region": ("African_region_report_2025_incidence.csv", "African_region_report_2025_RR_prevalence.csv"),
+    "WHO/PAHO Region of the Americas": ("Region_of_the_Americas_report_2025_incidence.csv", "Region_of_the_Americas_report_2025_RR_prevalence.csv"),
+    "WHO Eastern Mediterranean Region": ("Eastern_Mediterranean_region_report_2025_incidence.csv", "Eastern_Mediterranean_region_report_2025_RR_prevalence.csv"),
+    "WHO European Region": ("European_region_report_2025_incidence.csv", "European_region_report_2025_RR_prevalence.csv"),
+    "WHO South-East Asia Region": ("South_East_Asia_Region_report_2025_incidence.csv", "South_East_Asia_Region_report_2025_RR_prevalence.csv"),
+    "WHO Western Pacific Region": ("Western_Pacific_Region_report_2025_incidence.csv", "Western_Pacific_Region_report_2025_RR_prevalence.csv")
+}
+
+# Define Colors
+COLOR_INCIDENCE = "#2ca02c"      # Green
+COLOR_CI = "#98df8a"             # Light Green
+COLOR_RR_PREV = "#ffbb78"        # Light Orange
+COLOR_RR_NEW = "#ff7f0e"         # Dark Orange
+
+# Define Readable Labels (for the Legend)
+LABEL_INCIDENCE = "TB Incidence (per 100k)"
+LABEL_RR_PREV = "RR-TB: Previously Treated Cases (%)"
+LABEL_RR_NEW = "RR-TB: New Cases (%)"
+
+# Indicator column -> readable label (used for the long-format line data)
+INDICATOR_LABELS = {
+    "tb_incidence": LABEL_INCIDENCE,
+    "rr_prev_prevtx": LABEL_RR_PREV,
+    "rr_prev_new": LABEL_RR_NEW
+}
+
+# Encoding pieces of the chart, defined once and shared by the layers and
+# by every region's spec (nothing mutates them)
+_BASE_X = {"field": "year", "type": "ordinal", "axis": {"title": "Year"}}
+_YEAR_TOOLTIP = {"field": "year", "type": "ordinal", "title": "Year"}
+_CI_TOOLTIP = [
+    _YEAR_TOOLTIP,
+    {"field": "tb_incidence_low", "type": "quantitative", "title": "Incidence CI Low"},
+    {"field": "tb_incidence_high", "type": "quantitative", "title": "Incidence CI High"}
+]
+# Use the readable label column for Color
+_LINE_COLOR = {
+    "field": "Legend_Label",
+    "type": "nominal",
+    "scale": {
+        # Map the readable labels to colors
+        "domain": [LABEL_INCIDENCE, LABEL_RR_PREV, LABEL_RR_NEW],
+        "range": [COLOR_INCIDENCE, COLOR_RR_PREV, COLOR_RR_NEW]
     },
-    "WHO Western Pacific Region": {
-        "incidence": "Western_Pacific_Region_report_2025_incidence.csv",
-        "rr": "Western_Pacific_Region_report_2025_RR_prevalence.csv"
-    }
+    "legend": {"title": "Indicator Details", "orient": "right"}
 }
+# Tooltip uses the readable label
+_LINE_TOOLTIP = [
+    _YEAR_TOOLTIP,
+    {"field": "Legend_Label", "type": "nominal", "title": "Type"},
+    {"field": "Value", "type": "quantitative", "title": "Value", "format": ".1f"}
+]
 
-# --- 2. DATA LOADING FUNCTION ---
-@st.cache_data
-def load_data(region_key):
-    files = DATA_FILES.get(region_key)
-    if not files:
-        return pd.DataFrame() 
+# Chart specification (Vega-Lite v5)
+# Written out by hand instead of built with Altair: the chart structure is fixed,
+# so this skips Altair's to_dict()/schema validation on every rerun.
+# Identical for every region: the title is bound to the regionName param,
+# whose value is the only thing set per region. The data is passed to
+# st.vega_lite_chart separately: the wide frame feeds the CI band, the
+# precomputed long frame is the named "lines" dataset.
+VEGA_LITE_SPEC = {
+    "$schema": "https://vega.github.io/schema/vega-lite/v5.json",
+    "height": 500,
+    "params": [{"name": "regionName", "value": "Global"}],
+    "title": {"text": {"expr": "regionName + ': Incidence & Resistance Trends'"}},
+    "encoding": {"x": _BASE_X},
+    "layer": [
+        # Layer 1: 95% Confidence Interval (Band)
+        {
+            "mark": {"type": "area", "opacity": 0.3, "color": COLOR_CI},
+            "encoding": {
+                "y": {"field": "tb_incidence_low", "type": "quantitative"},
+                "y2": {"field": "tb_incidence_high"},
+                "tooltip": _CI_TOOLTIP
+            }
+        },
+        # Layer 2: Lines (Interactive Legend Logic)
+        # Reads the long-format data, already melted and labelled in pandas,
+        # so Vega runs no fold/calculate transforms in the browser
+        {
+            "data": {"name": "lines"},
+            "mark": {"type": "line", "point": True, "strokeWidth": 3},
+            "encoding": {
+                "y": {"field": "Value", "type": "quantitative", "axis": {"title": "Indicator Value"}},
+                "color": _LINE_COLOR,
+                "tooltip": _LINE_TOOLTIP
+            }
+        }
+    ]
+}
 
-    try:
-        inc_df = pd.read_csv(files["incidence"])
-        rr_df = pd.read_csv(files["rr"])
+# --- 2. DATA LOADING FUNCTIONS ---
+# All regions share the same CSV schema, so they are cleaned once and stored
+# together as a single tidy Parquet file keyed by a 'region' column.
+# Cold starts read one small columnar file instead of parsing 14 CSVs.
+# The file is only a speedup: if it cannot be written, the data is used
+# straight from memory.
+CACHE_DIR = Path("cache")
+# Bump the version whenever the cleaned columns or their dtypes change, so an
+# older file is never read back as the current format
+ALL_REGIONS_PARQUET = CACHE_DIR / "tb_all_regions.v2.parquet"
 
+# Columns read from each CSV (source name -> clean name) and their types.
+# Only these columns are parsed, and the explicit dtypes skip type inference.
+INCIDENCE_COLUMNS = {
+    'Category': 'year',
+    'Estimated TB incidence per 100 000 population': 'tb_incidence',
+    'Uncertainty interval (low)': 'tb_incidence_low',
+    'Uncertainty interval (high)': 'tb_incidence_high'
+}
+RR_COLUMNS = {
+    'Category': 'year',
+    'Previously treated pulmonary bacteriologically confirmed cases': 'rr_prev_prevtx',
+    'New pulmonary bacteriologically confirmed cases': 'rr_prev_new'
+}
+INCIDENCE_DTYPES = {col: ("int16" if col == 'Category' else "float64") for col in INCIDENCE_COLUMNS}
+RR_DTYPES = {col: ("int16" if col == 'Category' else "float64") for col in RR_COLUMNS}
+# Columns of the merged all-regions frame, in order
+ALL_REGIONS_COLUMNS = ['region', *dict.fromkeys([*INCIDENCE_COLUMNS.values(), *RR_COLUMNS.values()])]
+
+def _build_all_regions():
+    """Read every region's CSV pair, merge them into one frame and return it.
+
+    The frame is also written to ALL_REGIONS_PARQUET when possible.
+    """
+    inc_frames = []
+    rr_frames = []
+    for region_key, (inc_path, rr_path) in DATA_FILES.items():
         # Clean Incidence Data
-        if 'Category' in inc_df.columns:
-            inc_df = inc_df.rename(columns={'Category': 'year'})
-        
-        inc_clean = inc_df.rename(columns={
-            'Estimated TB incidence per 100 000 population': 'tb_incidence',
-            'Uncertainty interval (low)': 'tb_incidence_low',
-            'Uncertainty interval (high)': 'tb_incidence_high'
-        })
-        cols_to_keep = ['year', 'tb_incidence', 'tb_incidence_low', 'tb_incidence_high']
-        inc_clean = inc_clean[[c for c in cols_to_keep if c in inc_clean.columns]]
+        inc_clean = pd.read_csv(
+            inc_path, usecols=list(INCIDENCE_COLUMNS), dtype=INCIDENCE_DTYPES, engine="pyarrow"
+        ).rename(columns=INCIDENCE_COLUMNS)
+        inc_clean["region"] = region_key
+        inc_frames.append(inc_clean)
 
         # Clean RR Prevalence Data
-        if 'Category' in rr_df.columns:
-            rr_df = rr_df.rename(columns={'Category': 'year'})
-            
-        rr_clean = rr_df.rename(columns={
-            'Previously treated pulmonary bacteriologically confirmed cases': 'rr_prev_prevtx',
-            'New pulmonary bacteriologically confirmed cases': 'rr_prev_new'
-        })
-        cols_to_keep_rr = ['year', 'rr_prev_prevtx', 'rr_prev_new']
-        rr_clean = rr_clean[[c for c in cols_to_keep_rr if c in rr_clean.columns]]
-
-        # Merge
-        if not inc_clean.empty and not rr_clean.empty:
-            merged = pd.merge(inc_clean, rr_clean, on='year', how='inner')
-            merged = merged[(merged['year'] >= 2015) & (merged['year'] <= 2023)]
-            return merged
-        else:
-            return pd.DataFrame()
+        rr_clean = pd.read_csv(
+            rr_path, usecols=list(RR_COLUMNS), dtype=RR_DTYPES, engine="pyarrow"
+        ).rename(columns=RR_COLUMNS)
+        rr_clean["region"] = region_key
+        rr_frames.append(rr_clean)
+
+    # Merge (once, for all regions)
+    keys = ['region', 'year']
+    merged = (
+        pd.concat(inc_frames).set_index(keys)
+        .join(pd.concat(rr_frames).set_index(keys), how='inner')
+        .reset_index()
+    )
+    merged = merged.loc[merged['year'].between(2015, 2023, inclusive="both")]
+
+    # Best effort: a read-only or unusable cache directory must not stop the app
+    try:
+        CACHE_DIR.mkdir(exist_ok=True)
+        merged.to_parquet(ALL_REGIONS_PARQUET, engine="pyarrow", compression="zstd", index=False)
+    except OSError:
+        pass
+
+    return merged
+
+@st.cache_resource
+def _load_all():
+    """Return the merged data for every region.
+
+    Rebuilds it from the CSVs if the Parquet file is missing, older than a
+    CSV, unreadable, or does not have the expected columns.
+    """
+    try:
+        csv_mtime = max(os.path.getmtime(path) for paths in DATA_FILES.values() for path in paths)
+        if ALL_REGIONS_PARQUET.is_file() and ALL_REGIONS_PARQUET.stat().st_mtime >= csv_mtime:
+            try:
+                cached = pd.read_parquet(ALL_REGIONS_PARQUET, engine="pyarrow")
+            except Exception:
+                cached = None  # unreadable file: rebuild it below
+            if cached is not None and list(cached.columns) == ALL_REGIONS_COLUMNS:
+                return cached
+        return _build_all_regions()
 
     except Exception as e:
-        st.error(f"Error loading data for {region_key}: {e}")
+        st.error(f"Error loading data: {e}")
         return pd.DataFrame()
 
+@st.cache_resource
+def _preload_all():
+    """Split the all-regions data into one frame per region, once per process.
+
+    The first load_data() call therefore warms the cache for every region.
+    """
+    all_df = _load_all()
+    if all_df.empty:
+        return {}
+
+    frames = {}
+    for region_key, region_df in all_df.groupby("region", sort=False):
+        df = region_df.drop(columns="region").reset_index(drop=True)
+
+        # Long format for the line layer: one row per (year, indicator)
+        df_long = df.melt(
+            id_vars=["year"],
+            value_vars=list(INDICATOR_LABELS),
+            var_name="Indicator_Code",
+            value_name="Value"
+        )
+        df_long["Legend_Label"] = df_long["Indicator_Code"].map(INDICATOR_LABELS)
+
+        frames[region_key] = (df, df_long)
+    return frames
+
+def load_data(region_key):
+    """Return (merged data, long-format line data) for one region (empty frames if it is not available).
+
+    The frames are preloaded and shared through the _preload_all() cache, so
+    switching region is a dict lookup; callers must treat them as read-only.
+    """
+    return _preload_all().get(region_key, (pd.DataFrame(), pd.DataFrame()))
+
+def build_chart_spec(region_key):
+    """Return the Vega-Lite spec for one region.
+
+    Shallow copy of VEGA_LITE_SPEC with only the regionName param replaced;
+    the layers and encodings are shared, so callers must treat it as read-only.
+    """
+    return {**VEGA_LITE_SPEC, "params": [{"name": "regionName", "value": region_key}]}
+
+# Page sections are fragments, so an interaction inside one of them only
+# reruns that section instead of the whole script.
+@st.fragment
+def render_chart(region_key):
+    df, df_long = load_data(region_key)
+
+    # Same region as the last render in this session: reuse the finished spec
+    if st.session_state.get("last_region") == region_key and "last_chart_spec" in st.session_state:
+        spec = st.session_state["last_chart_spec"]
+    else:
+        spec = {**build_chart_spec(region_key), "datasets": {"lines": df_long}}
+        st.session_state["last_region"] = region_key
+        st.session_state["last_chart_spec"] = spec
+
+    # Pass the data separately from the spec: Streamlit sends both frames to
+    # the browser as Arrow IPC instead of row-wise JSON inside the spec.
+    st.vega_lite_chart(df, spec, use_container_width=True)
+
+@st.fragment
+def render_source_data(region_key):
+    with st.expander("View Source Data"):
+        df, _ = load_data(region_key)
+        st.dataframe(df)
+
 # --- 3. STREAMLIT APP LAYOUT ---
 st.set_page_config(page_title="TB Trends Visualization", layout="wide")
 
@@ -87,95 +263,19 @@ st.title("Trend comparison of TB incidence and RR-TB prevalence (2015–2023)")
 st.markdown("### Disease Burden vs. Drug Resistance")
 
 # --- 4. INTERACTIVE CONTROLS ---
-region_options = [
-    "Global",
-    "WHO African Region",
-    "WHO/PAHO Region of the Americas",
-    "WHO Eastern Mediterranean Region",
-    "WHO European Region",
-    "WHO South-East Asia Region",
-    "WHO Western Pacific Region"
-]
+region_options = list(DATA_FILES)
 
 selected_region = st.selectbox("Select WHO Region:", region_options)
 
 # Load Data
-df = load_data(selected_region)
+df, _ = load_data(selected_region)
 
 if df.empty:
     st.warning(f"Data not found for **{selected_region}**.")
 else:
-    # --- 5. ALTAIR VISUALIZATION ---
-    
-    # Define Colors
-    COLOR_INCIDENCE = "#2ca02c"      # Green
-    COLOR_CI = "#98df8a"             # Light Green
-    COLOR_RR_PREV = "#ffbb78"        # Light Orange
-    COLOR_RR_NEW = "#ff7f0e"         # Dark Orange
-
-    # Define Readable Labels (for the Legend)
-    LABEL_INCIDENCE = "TB Incidence (per 100k)"
-    LABEL_RR_PREV = "RR-TB: Previously Treated Cases (%)"
-    LABEL_RR_NEW = "RR-TB: New Cases (%)"
-    
-    # Base chart
-    base = alt.Chart(df).encode(
-        x=alt.X('year:O', axis=alt.Axis(title='Year'))
-    )
-
-    # Layer 1: 95% Confidence Interval (Band)
-    ci_band = base.mark_area(opacity=0.3, color=COLOR_CI).encode(
-        y=alt.Y('tb_incidence_low:Q'),
-        y2=alt.Y2('tb_incidence_high:Q'),
-        tooltip=[
-            alt.Tooltip('year:O', title='Year'),
-            alt.Tooltip('tb_incidence_low:Q', title='Incidence CI Low'),
-            alt.Tooltip('tb_incidence_high:Q', title='Incidence CI High')
-        ]
-    )
-
-    # Layer 2: Lines (Interactive Legend Logic)
-    # 1. Fold the columns (transform wide to long)
-    # 2. Calculate a new column 'Legend Label' to replace cryptic codes with readable text
-    lines_base = base.transform_fold(
-        ['tb_incidence', 'rr_prev_prevtx', 'rr_prev_new'],
-        as_=['Indicator_Code', 'Value']
-    ).transform_calculate(
-        # Vega Expression to map codes to readable labels
-        Legend_Label="datum.Indicator_Code == 'tb_incidence' ? '" + LABEL_INCIDENCE + "' : " +
-                     "datum.Indicator_Code == 'rr_prev_prevtx' ? '" + LABEL_RR_PREV + "' : '" + LABEL_RR_NEW + "'"
-    )
-
-    lines = lines_base.mark_line(point=True, strokeWidth=3).encode(
-        y=alt.Y('Value:Q', axis=alt.Axis(title='Indicator Value')),
-        # Use the NEW readable label column for Color
-        color=alt.Color('Legend_Label:N', 
-                        scale=alt.Scale(
-                            # Map the readable labels to colors
-                            domain=[LABEL_INCIDENCE, LABEL_RR_PREV, LABEL_RR_NEW],
-                            range=[COLOR_INCIDENCE, COLOR_RR_PREV, COLOR_RR_NEW]
-                        ),
-                        legend=alt.Legend(title="Indicator Details", orient='right') # Legend Title
-        ),
-        # Tooltip now uses the readable label
-        tooltip=[
-            alt.Tooltip('year:O', title='Year'),
-            alt.Tooltip('Legend_Label:N', title='Type'),
-            alt.Tooltip('Value:Q', title='Value', format='.1f')
-        ]
-    )
-
-    chart = alt.layer(
-        ci_band,
-        lines
-    ).properties(
-        title=f"{selected_region}: Incidence & Resistance Trends",
-        height=500
-    ).interactive()
-
-    st.altair_chart(chart, use_container_width=True)
+    # --- 5. VEGA-LITE VISUALIZATION ---
+    render_chart(selected_region)
     
     st.caption("Note: 'Incidence' is a rate per 100,000 population. 'RR-TB' values are percentages (%). Comparison focuses on trend direction.")
 
-    with st.expander("View Source Data"):
-        st.dataframe(df)
\ No newline at end of file
+    render_source_data(selected_region)
\ No newline at end of file